@@ -50,6 +50,20 @@ UPDATES:------------------------------------------------------------------------
 05/05/20 - Added a debug function to allow printing of messages to terminal.
 05/14/20 - Added Astral, Schedule modules and function astral_update() so I can display sunrise and sunset on LCD.
 10/31/20 - Fixed Astral.  Now using most recent version of astral (2.2).
+10/19/2026 - Added a main loop watchdog using loopwatchdog.py.  If one pass of main_loop takes longer than
+             loopBudget seconds the stacks of all threads are printed along with how long the stall lasted.
+10/19/2026 - Added an on-demand sampling profiler using profiler.py.  Send SIGUSR1 to start profiling and again to
+             stop.  A flame graph compatible profile is written to the logs folder.
+10/19/2026 - Added the shared memory state bus using statebus.py.  Open/close times and door state now come from
+             main.py through the bus instead of being worked out again here.  astral_update is only used if main.py
+             isn't running.  Sensor readings are published to the bus when they're read.
+10/19/2026 - Sensor reads now go through sensorread.py.  Each sensor has a deadline, a few retries and a circuit
+             breaker, so a sensor that NAKs or hangs no longer stalls or kills the LCD cycle.  If a read fails the
+             last good reading is shown along with how old it is.
+10/19/2026 - Sensor readings are now recorded every recordMinutes minutes to logs/coop_readings.log using
+             eventlog.py.  Use coopexport.py to pull them off the Pi.
+10/19/2026 - main.py can now run several coops.  The open/close times shown are for the first coop in coops.ini and
+             when there's more than one coop an extra screen shows every coop's door.
 """
 
 # TODO: Look into using InfluxDB and Grafana to log sensor data.
@@ -61,7 +75,9 @@ from adafruit_ina260 import INA260, Mode, AveragingCount
 import i2c_lcd_driver
 import board
 import busio
+import signal
 import sys
+import os
 import time
 from datetime import date
 import datetime
@@ -69,6 +85,11 @@ from astral import LocationInfo
 from astral.sun import sun
 import pytz
 import schedule
+import loopwatchdog
+import profiler
+import statebus
+import sensorread
+import eventlog
 
 
 # Initialize lcd
@@ -94,6 +115,29 @@ debug = True
 opentime = 0
 closetime = 0
 
+# Most seconds a single pass of main_loop should take before it's treated as a stall.  See loopwatchdog.py.
+# coopstats shows its screens for up to 22 seconds (3 + 4 + 4 + 4 + 4 for the coop doors screen + 3) and can wait up to
+# 2 seconds on sensor deadlines.  A record_readings job in the same pass adds up to another 2 seconds.  That's about
+# 26 seconds for a normal pass, so allow plenty of headroom before calling it a stall.
+loopBudget = 45
+
+# Folder logs and profiles are written to.
+logDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+
+# Seconds a profile started with SIGUSR1 runs for.  See profiler.py.
+profileWindow = 60
+
+# Sensor readings are recorded every recordMinutes to the readings log.  See eventlog.py and coopexport.py.
+recordMinutes = 5
+readingsLog = eventlog.EventLog(os.path.join(logDir, 'coop_readings.log'))
+
+# Shared memory state bus.  control.py is the only writer of the sensor section.  See statebus.py.
+try:
+    stateBus = statebus.StateBus()
+except (RuntimeError, OSError) as error:
+    print('State bus not available: ' + str(error))
+    stateBus = None
+
 
 def current_time():
     #  Used if you opt to print current date/time of opening and closing door.
@@ -118,6 +162,8 @@ def am2320():
     am = adafruit_am2320.AM2320(i2c)
     cooptemp = round(fahrenheit(am.temperature), 2)
     coophumidity = am.relative_humidity
+    if stateBus is not None:
+        stateBus.publish_sensors(cooptemp=cooptemp, coophumidity=coophumidity, am2320_time=time.time())
     return cooptemp, coophumidity
 
 
@@ -130,6 +176,9 @@ def solarstatus():
     current = ina260.current
     voltage = ina260.voltage
     power = ina260.power
+    if stateBus is not None:
+        stateBus.publish_sensors(solar_current=current, solar_voltage=voltage, solar_power=power,
+                                 solar_time=time.time())
     return current, voltage, power
 
 
@@ -141,9 +190,35 @@ def batterystatus():
     current = ina260.current
     voltage = ina260.voltage
     power = ina260.power
+    if stateBus is not None:
+        stateBus.publish_sensors(battery_current=current, battery_voltage=voltage, battery_power=power,
+                                 battery_time=time.time())
     return current, voltage, power
 
 
+# Deadline bounded readers for each sensor.  See sensorread.py.
+# The AM2320 NAKs while it wakes up so it gets a longer deadline and more retries.
+am2320Sensor = sensorread.DeadlineSensor('am2320', am2320, deadline=1.0, retries=3, backoff=0.1)
+solarSensor = sensorread.DeadlineSensor('solar', solarstatus, deadline=0.5)
+batterySensor = sensorread.DeadlineSensor('battery', batterystatus, deadline=0.5)
+
+
+def record_readings():
+    """Function reads every sensor and records the fresh readings to the readings log.  Stale readings are left out."""
+    fields = {}
+    reading = am2320Sensor.read()
+    if reading.fresh:
+        fields['cooptemp'], fields['coophumidity'] = reading.value
+    reading = solarSensor.read()
+    if reading.fresh:
+        fields['solar_current'], fields['solar_voltage'], fields['solar_power'] = reading.value
+    reading = batterySensor.read()
+    if reading.fresh:
+        fields['battery_current'], fields['battery_voltage'], fields['battery_power'] = reading.value
+    fields['cpu_temperature'] = CPUTemperature().temperature
+    readingsLog.log('reading', **fields)
+
+
 def set_coop_light_relay(status):
     """Function called to set the initial state of the light relay.  Under current programing should always be False."""
     if status:
@@ -167,6 +242,13 @@ def astral_update():
         times of day"""
     global opentime
     global closetime
+    door = stateBus.read_door() if stateBus is not None else None
+    if door is not None and door['opentime'] and datetime.date.fromtimestamp(door['updated']) == date.today():
+        # main.py is running and has already worked out today's times.  The bus outlives main.py, so older times
+        # mean main.py has stopped and they're worked out here instead.
+        opentime = door['opentime']
+        closetime = door['closetime']
+        return opentime, closetime
     # astral.Location format is: City, Country, Long, Lat, Time Zone, elevation.
     city = LocationInfo('lincoln city', 'USA', 'US/Pacific', 45.014, -123.909)
     s = sun(city.observer, date=date.today(), tzinfo=pytz.timezone(city.timezone))
@@ -175,37 +257,65 @@ def astral_update():
     return opentime, closetime
 
 
+def power_status(title, column, sensor):
+    """Function displays current, voltage and power from an ina260 sensor on the LCD."""
+    reading = sensor.read()
+    if reading.error:
+        debug_print(reading.error + ' at: ')
+    # A stale reading shows its age after the title, so move the title left to make room.
+    lcd.lcd_display_string(title + ' ' + sensorread.age_text(reading), 1, column if reading.fresh else 0)
+    if reading.value is None:
+        lcd.lcd_display_string('No reading', 2, 0)
+        return
+    current, voltage, power = reading.value
+    lcd.lcd_display_string('Voltage: %.2f V' % voltage, 2, 0)
+    lcd.lcd_display_string('Current: %.2f mA' % current, 3, 0)
+    lcd.lcd_display_string('Power: %.2f mW' % power, 4, 0)
+
+
 def coopstats():
     """Function displays various sensor readings on LCD."""
     debug_print('LCD Button Pressed: ')
     lcd.backlight(1)  # Turn LCD backlight on
     lcd.lcd_clear()
-    cooptemp, coophudity = am2320()
+    reading = am2320Sensor.read()
+    if reading.error:
+        debug_print(reading.error + ' at: ')
     lcd.lcd_display_string('Chicken Coop', 1, 4)  # String, row, column
-    lcd.lcd_display_string('Temp: ' + str(cooptemp) + chr(223), 2, 0)
-    lcd.lcd_display_string('Humidity: ' + str(coophudity) + chr(223), 3, 0)
+    if reading.value is None:
+        lcd.lcd_display_string('Temp: --', 2, 0)
+        lcd.lcd_display_string('Humidity: --', 3, 0)
+    else:
+        cooptemp, coophudity = reading.value
+        lcd.lcd_display_string('Temp: ' + str(cooptemp) + chr(223) + ' ' + sensorread.age_text(reading), 2, 0)
+        lcd.lcd_display_string('Humidity: ' + str(coophudity) + chr(223) + ' ' + sensorread.age_text(reading), 3, 0)
     time.sleep(3)
     lcd.lcd_clear()
-    current, voltage, power = solarstatus()  # Grab solar panel voltage, current, power and display it.
-    lcd.lcd_display_string('Solar Status', 1, 4)
-    lcd.lcd_display_string('Voltage: %.2f V' % voltage, 2, 0)
-    lcd.lcd_display_string('Current: %.2f mA' % current, 3, 0)
-    lcd.lcd_display_string('Power: %.2f mW' % power, 4, 0)
+    power_status('Solar Status', 4, solarSensor)  # Grab solar panel voltage, current, power and display it.
     time.sleep(4)
     lcd.lcd_clear()
-    current, voltage, power = batterystatus()  # Grab battery voltage, current, power and display it.
-    lcd.lcd_display_string('Battery Status', 1, 3)
-    lcd.lcd_display_string('Voltage: %.2f V' % voltage, 2, 0)
-    lcd.lcd_display_string('Current: %.2f mA' % current, 3, 0)
-    lcd.lcd_display_string('Power: %.2f mW' % power, 4, 0)
+    power_status('Battery Status', 3, batterySensor)  # Grab battery voltage, current, power and display it.
     time.sleep(4)
     lcd.lcd_clear()
+    astral_update()  # Pick up the latest times from main.py.
     lcd.lcd_display_string('Open & Close Time', 1, 2)
-    lcd.lcd_display_string('Sunrise: ' + str(opentime), 2, 0)
-    lcd.lcd_display_string('Sunset: ' + str(closetime), 3, 0)
+    lcd.lcd_display_string('Open: ' + str(opentime), 2, 0)
+    lcd.lcd_display_string('Close: ' + str(closetime), 3, 0)
+    door = stateBus.read_door() if stateBus is not None else None
+    if door is not None:
+        lcd.lcd_display_string('Door: ' + door['door'] + (' Sched' if door['use_schedule'] else ' Manual'), 4, 0)
     time.sleep(4)
+    doors = stateBus.read_doors() if stateBus is not None else []
+    if len(doors) > 1:
+        lcd.lcd_clear()
+        lcd.lcd_display_string('Coop Doors', 1, 5)
+        for row, door in enumerate(doors[:3], 2):  # Room for three coops under the title.
+            lcd.lcd_display_string(door['name'][:11] + ': ' + door['door'], row, 0)
+        time.sleep(4)
     lcd.lcd_clear()
     cpu = CPUTemperature()
+    if stateBus is not None:
+        stateBus.publish_sensors(cpu_temperature=cpu.temperature, cpu_time=time.time())
     lcd.lcd_display_string('CPU Temperature', 1, 2)
     lcd.lcd_display_string('Temp: ' + str(cpu.temperature) + ' C', 2, 0)  # Display CPU temperature.
     time.sleep(3)
@@ -223,20 +333,49 @@ def startup_display():
     lcd.backlight(0)
 
 
+def report_stall(stall):
+    """Function called by the loop watchdog when main_loop stalls and again when it recovers."""
+    if stall['ended']:
+        debug_print('Main loop recovered after ' + str(stall['seconds']) + ' seconds at: ')
+    else:
+        debug_print('Main loop stalled for ' + str(stall['seconds']) + ' seconds at: ')
+        for name, stack in stall['stacks'].items():
+            print('Thread ' + name + ':\n' + stack)
+
+
+def profile_written(path, samples):
+    """Function called by the profiler once a profile has been written."""
+    debug_print('Profile of ' + str(samples) + ' samples written to ' + path + ' at: ')
+
+
+def terminate(signum, frame):
+    """Function called when systemd stops or restarts the service with SIGTERM.  Python's default would exit without
+    writing out the buffered readings, so it's treated the same as Ctrl+C."""
+    raise KeyboardInterrupt
+
+
 def main_loop():
+    loopWatchdog = loopwatchdog.LoopWatchdog(loopBudget, on_stall=report_stall)
+    loopWatchdog.start()
     while True:
+        loopWatchdog.kick()
         schedule.run_pending()
         if lightOnButton.is_pressed:
             toggle_coop_light_relay()
         if lcdButton.is_pressed:
             coopstats()
+        readingsLog.flush_if_due()  # Write out buffered readings once the flush interval has passed.
         time.sleep(1)
 
 
 if __name__ == '__main__':
     try:
+        signal.signal(signal.SIGTERM, terminate)
+        profiler.install_signal_toggle(profiler.SamplingProfiler(logDir, window=profileWindow,
+                                                                 on_write=profile_written))
         astral_update()  # Initiate astral_update.  Get Astral times
         schedule.every().day.at('12:01').do(astral_update)  # Update astral times first thing every morning.
+        schedule.every(recordMinutes).minutes.do(record_readings)  # Record sensor readings for coopexport.py.
         startup_display()
         main_loop()
     except RuntimeError as error:
@@ -247,6 +386,7 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         # turn the relay off
         set_coop_light_relay(False)
+        readingsLog.close()  # Write out any buffered readings before exiting.
         print('\nExiting application\n')
         # exit the application
         sys.exit(0)
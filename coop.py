@@ -0,0 +1,343 @@
+"""
+coop.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+The door and lights logic for a single chicken coop, moved out of main.py so that one Pi can run several coops.
+
+Each CoopController is made from one section of coops.ini and has its own pins, location, sun event offsets,
+schedule override, light relay, state snapshot and (optionally) current sensing door actuator.  Nothing in here polls
+or sleeps.  Buttons hand their action to the shared event loop in main.py, and door and light times are jobs on the
+shared scheduler tagged with the coop's name, so adding a coop adds no threads or wakeups of its own.
+
+coops.ini options for each coop, any of which can also go in [DEFAULT] to be shared by every coop:
+
+    open_button, close_button, stop_button  GPIO for the door buttons.
+    bounce_time                             Seconds to ignore a button after it's pressed, filters switch bounce.
+    motor_open, motor_close                 GPIO for the L298 inputs.
+    schedule_button, schedule_led           GPIO for the schedule override button and LED.
+    light_relay, light_button               GPIO for the interior light relay and its button.
+    relay_active_high, relay_initial_value  How the relay is driven.  See the relay notes in coops.ini.
+    city, region, timezone                  Location used by astral.
+    latitude, longitude
+    open_event, close_event                 Astral sun events, any of dawn, sunrise, noon, sunset or dusk.
+    open_offset, close_offset               Minutes to add to the sun event, can be negative.
+    interior_lights, light_minutes          Turn interior lights on light_minutes before the door closes.
+    current_sensing, motor_sensor_address   Current sensing end of travel.  See doortravel.py.
+    stall_current, end_current, max_travel
+    state_file                              State snapshot file name.  See coopstate.py.
+
+Any of the pins can be left out if that coop doesn't have one.
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+gpiozero
+schedule
+astral
+"""
+
+from gpiozero import Button, Motor, LED
+import gpiozero
+import schedule
+import datetime
+from datetime import date
+from astral import LocationInfo
+from astral.sun import sun
+import pytz
+import os
+import traceback
+import coopstate
+import doortravel
+
+
+class CoopController:
+    def __init__(self, name, config, event_log, state_dir, state_bus=None, bus_index=0, scheduler=schedule,
+                 debug=True):
+        """name is the coop's section name in coops.ini and config that section.  event_log and state_bus are shared
+        by every coop.  bus_index is this coop's slot on the state bus."""
+        self.name = name
+        self.eventLog = event_log
+        self.stateBus = state_bus
+        self.busIndex = bus_index
+        self.scheduler = scheduler
+        self.debug = debug
+
+        #  GPIO pins used
+        # Buttons fire on each press, so a bouncy switch would otherwise toggle the schedule or lights more than once.
+        bounce = config.getfloat('bounce_time', 0.2)
+        self.buttonOpen = _button(config, 'open_button', bounce)
+        self.buttonClose = _button(config, 'close_button', bounce)
+        self.buttonStop = _button(config, 'stop_button', bounce)
+        self.motor = Motor(config.getint('motor_open'), config.getint('motor_close'))  # Open first, close second.
+        self.buttonSchedOverride = _button(config, 'schedule_button', bounce)
+        self.ledSchedOff = LED(config.getint('schedule_led')) if config.get('schedule_led') else None
+        self.lightOnButton = _button(config, 'light_button', bounce)
+        self.coopLightRelay = None
+        if config.get('light_relay'):
+            self.coopLightRelay = gpiozero.OutputDevice(config.getint('light_relay'),
+                                                        active_high=config.getboolean('relay_active_high', True),
+                                                        initial_value=config.getboolean('relay_initial_value', True))
+
+        # astral.LocationInfo format is: City, Region, Time Zone, Lat, Long.
+        self.city = LocationInfo(config.get('city', name), config.get('region', ''), config.get('timezone'),
+                                 config.getfloat('latitude'), config.getfloat('longitude'))
+        self.openEvent = config.get('open_event', 'sunrise')
+        self.openOffset = config.getint('open_offset', 0)
+        self.closeEvent = config.get('close_event', 'dusk')
+        self.closeOffset = config.getint('close_offset', 0)
+        self.interiorLights = config.getboolean('interior_lights', True) and self.coopLightRelay is not None
+        self.lightMinutes = config.getint('light_minutes', 10)
+
+        self.currentSensing = config.getboolean('current_sensing', False)
+        self.motorSensorAddress = int(config.get('motor_sensor_address', '0x44'), 0)
+        self.stallCurrent = config.getfloat('stall_current', 3000)
+        self.endCurrent = config.getfloat('end_current', 100)
+        self.maxTravel = config.getfloat('max_travel', 60)
+        self.doorActuator = None  # Created by restore_state when currentSensing is True.
+
+        self.stateFile = coopstate.StateFile(os.path.join(state_dir,
+                                                          config.get('state_file', 'coop_state_%s.json' % name)))
+        self.doorState = coopstate.DOOR_UNKNOWN  # Last position the door was driven to.
+        self.useSchedule = True
+        self.opentime = None
+        self.closetime = None
+        self.interiorlights = None
+
+    def debug_print(self, message):
+        if self.debug:
+            print(self.name + ': ' + message)
+
+    def log(self, event, **fields):
+        """Function records an event for this coop in the shared event log."""
+        self.eventLog.log(event, coop=self.name, **fields)
+
+    def relay_state(self):
+        return bool(self.coopLightRelay.value) if self.coopLightRelay is not None else False
+
+    def start(self):
+        """Function gets today's times, restores the saved state and schedules the day's events."""
+        self.astral_update()
+        self.restore_state()
+        self.schedule_events()
+
+    def connect_buttons(self, post):
+        """Function hooks the coop's buttons up to post, which queues an action for the shared event loop.
+        gpiozero watches the pins itself, so nothing is polled."""
+        for button, action in ((self.buttonOpen, self.open_door), (self.buttonClose, self.close_door),
+                               (self.buttonStop, self.stop_door), (self.buttonSchedOverride, self.toggle_scheduling),
+                               (self.lightOnButton, self.button_coop_light_relay)):
+            if button is not None:
+                button.when_pressed = _poster(post, action)
+
+    def save_state(self):
+        """Function saves the current coop state.  Only writes to the SD card if something has changed."""
+        travel = dict(self.doorActuator.travel_time) if self.doorActuator is not None else {}
+        self.stateFile.save(door=self.doorState, useSchedule=self.useSchedule, relay=self.relay_state(),
+                            travelTime=travel)
+        if self.stateBus is not None:
+            self.stateBus.publish_door(self.busIndex, door=self.doorState, use_schedule=self.useSchedule,
+                                       relay=self.relay_state())
+
+    def open_door(self):
+        if self.doorActuator is not None:
+            self.doorActuator.open()
+        else:
+            self.motor.forward()
+        self.debug_print("Door opened ")
+        self.log('door_open')
+        self.doorState = coopstate.DOOR_OPEN
+        self.save_state()
+
+    def close_door(self, toggle_lights=True):
+        if self.doorActuator is not None:
+            self.doorActuator.close()
+        else:
+            self.motor.backward()
+        self.debug_print("Door closed ")
+        self.log('door_close')
+        self.doorState = coopstate.DOOR_CLOSED
+        self.save_state()
+        if self.interiorLights and toggle_lights:
+            self.interior_lights_on_off()
+
+    def stop_door(self):
+        if self.doorActuator is not None:
+            self.doorActuator.stop()
+        else:
+            self.motor.stop()
+        self.debug_print("Door stopped ")
+        self.log('door_stop')
+        self.doorState = coopstate.DOOR_STOPPED
+        self.save_state()
+
+    def door_travel_finished(self, result):
+        """Function called by the door actuator when the door stops moving.  Runs on the door travel thread."""
+        if result['reason'] == 'stopped':
+            return  # stop_door has already dealt with it.
+        self.debug_print('Door ' + result['direction'] + ' ' + result['reason'] + ' after ' + str(result['seconds']) +
+                         ' seconds')
+        if result['obstruction']:
+            self.eventLog.log('door_obstruction', critical=True, coop=self.name, **result)
+            self.doorState = coopstate.DOOR_STOPPED
+        elif result['reason'] == 'sensor_error':
+            # The motor was cut part way, so the door could be anywhere.
+            self.eventLog.log('door_sensor_error', critical=True, coop=self.name, **result)
+            self.doorState = coopstate.DOOR_STOPPED
+        else:
+            self.log('door_travel', **result)
+        self.save_state()
+
+    def setup_door_actuator(self, travel_time=None):
+        """Function creates the current sensing door actuator if currentSensing is set."""
+        if self.currentSensing:
+            self.doorActuator = doortravel.CurrentSensingDoor(self.motor,
+                                                              doortravel.ina260_reader(self.motorSensorAddress),
+                                                              stall_current=self.stallCurrent,
+                                                              end_current=self.endCurrent,
+                                                              max_travel=self.maxTravel, travel_time=travel_time,
+                                                              on_finish=self.door_travel_finished)
+
+    def interior_lights_on_off(self):
+        # Function checks if interiorLights is True. If so will be used to toggle interior lights on and off.
+        if self.interiorLights:
+            self.coopLightRelay.toggle()
+            self.debug_print("Toggled lights ")
+            self.log('light_relay', state=self.relay_state(), source='schedule')
+            self.save_state()
+
+    def astral_update(self):
+        """Function grabs the open and close sun events for the coop's location and works out the day's times.
+        The events and offsets come from coops.ini.  Valid events are dawn, sunrise, noon, sunset and dusk."""
+        s = sun(self.city.observer, date=date.today(), tzinfo=pytz.timezone(self.city.timezone))
+        opening = s[self.openEvent] + datetime.timedelta(minutes=self.openOffset)
+        closing = s[self.closeEvent] + datetime.timedelta(minutes=self.closeOffset)
+        self.opentime = opening.strftime('%H:%M')
+        self.closetime = closing.strftime('%H:%M')
+        self.interiorlights = (closing - datetime.timedelta(minutes=self.lightMinutes)).strftime('%H:%M')
+        self.log('daily_times', opentime=self.opentime, closetime=self.closetime, interiorlights=self.interiorlights)
+        if self.stateBus is not None:
+            self.stateBus.publish_door(self.busIndex, name=self.name, opentime=self.opentime,
+                                       closetime=self.closetime, lightstime=self.interiorlights)
+        return self.opentime, self.closetime, self.interiorlights
+
+    def schedule_events(self):
+        """Function (re)schedules the coop's door opening and closing and interior lights for the current times."""
+        self.scheduler.clear(self.name)
+        self.scheduler.every().day.at(self.opentime).do(self._scheduled, self.open_door).tag(self.name)
+        self.scheduler.every().day.at(self.closetime).do(self._scheduled, self.close_door).tag(self.name)
+        if self.interiorLights:
+            self.scheduler.every().day.at(self.interiorlights).do(self._scheduled,
+                                                                 self.interior_lights_on_off).tag(self.name)
+        self.debug_print('Open Time: ' + str(self.opentime))
+        self.debug_print('Close Time: ' + str(self.closetime))
+        if self.interiorLights:
+            self.debug_print("Lights come on: " + str(self.interiorlights))
+
+    def refresh(self):
+        """Function updates the times for the new day and reschedules."""
+        self.astral_update()
+        self.schedule_events()
+
+    def _scheduled(self, action):
+        """Runs a scheduled action unless the coop's schedule has been overridden.  Errors are logged rather than
+        raised, schedule only reschedules a job that returns so a failing job would otherwise run on every pass."""
+        if self.useSchedule:
+            try:
+                action()
+            except Exception:
+                self.log_error(action)
+
+    def log_error(self, action):
+        """Function records an exception raised by one of the coop's actions so the other coops keep running."""
+        self.debug_print('Error in ' + action.__name__ + ': ' + traceback.format_exc())
+        self.eventLog.log('action_error', critical=True, coop=self.name, action=action.__name__,
+                          error=traceback.format_exc())
+
+    def scheduling_off(self):
+        self.debug_print('Schedule Off ')
+        if self.ledSchedOff is not None:
+            self.ledSchedOff.on()  # Turn on schedule LED.
+        self.useSchedule = False  # Turn off Scheduling.
+        self.log('schedule_off')
+        self.save_state()
+
+    def scheduling_on(self):
+        self.debug_print('Schedule On ')
+        if self.ledSchedOff is not None:
+            self.ledSchedOff.off()  # Turn off schedule LED.
+        self.useSchedule = True  # Turn on Scheduling.
+        self.log('schedule_on')
+        self.save_state()
+
+    def toggle_scheduling(self):
+        """Function called when the schedule override button is pressed."""
+        if self.useSchedule:
+            self.scheduling_off()  # If useSchedule is True/enabled then override scheduling by turning it off.
+        else:
+            self.scheduling_on()  # Scheduling is already off, turn it back on.
+
+    def set_coop_light_relay(self, status):
+        """Function called to set the state of the light relay.  Used to turn the relay off on exit."""
+        if self.coopLightRelay is None:
+            return
+        if status:
+            self.debug_print('Setting relay: ON ')
+            self.coopLightRelay.on()
+        else:
+            self.debug_print('Setting relay: OFF ')
+            self.coopLightRelay.off()
+        self.log('light_relay', state=self.relay_state(), source='set')
+
+    def button_coop_light_relay(self):
+        """Function called to turn on/off the light on relay when button is pressed"""
+        if self.coopLightRelay is None:
+            return
+        self.debug_print('toggling relay ')
+        self.coopLightRelay.toggle()
+        self.log('light_relay', state=self.relay_state(), source='button')
+        self.save_state()
+
+    def restore_state(self):
+        """Function restores the state saved before the last shutdown and catches up on any door opening or closing
+        that was missed while the Pi was down.  Must be called after astral_update so today's times are known."""
+        state = self.stateFile.load()
+        if state is None:
+            self.debug_print('No saved state, starting fresh ')
+            self.setup_door_actuator()
+            self.save_state()
+            return
+        self.setup_door_actuator(state.get('travelTime'))
+        self.doorState = state.get('door', coopstate.DOOR_UNKNOWN)
+        # Everything is restored before saving, so the relay's power on value never makes it into the snapshot.
+        self.useSchedule = state.get('useSchedule', True)
+        if self.ledSchedOff is not None:
+            self.ledSchedOff.value = not self.useSchedule  # LED is on while scheduling is off.
+        if self.coopLightRelay is not None:
+            self.coopLightRelay.value = state.get('relay', False)
+        self.save_state()
+        self.log('state_restored', door=self.doorState, useSchedule=self.useSchedule, relay=self.relay_state(),
+                 saved=state.get('ts'))
+        if self.useSchedule:
+            missed = coopstate.missed_door_event(self.doorState, self.opentime, self.closetime, state.get('ts'))
+            if missed is not None:
+                self.debug_print('Catching up missed door event: ' + missed)
+                self.log('catch_up', action=missed)
+                if missed == 'open':
+                    self.open_door()
+                else:
+                    self.close_door(toggle_lights=False)  # Light relay has already been restored, leave it as is.
+
+
+def _button(config, option, bounce_time):
+    """Returns a Button for the GPIO in option, or None if the coop doesn't have one."""
+    return Button(config.getint(option), bounce_time=bounce_time) if config.get(option) else None
+
+
+def _poster(post, action):
+    """Returns a callback for gpiozero that queues action.  Takes no arguments so gpiozero doesn't pass the button."""
+    def pressed():
+        post(action)
+    return pressed
@@ -0,0 +1,274 @@
+"""
+coopexport.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+Command line exporter for pulling the recorded sensor readings (logs/coop_readings.log, written by control.py) and
+door/light events (logs/coop_events.log, written by main.py) off the Pi for analysis.
+
+Records are streamed a line at a time from the oldest log file to the newest, so memory use stays the same no matter
+how long the time range is.  Rotated log files that finished before --start are skipped without being opened, and
+reading stops at the first record past --end.
+
+Readings can be downsampled with --every to 1 minute, 1 hour or 1 day buckets.  Each bucket gets the number of
+readings and the mean, min and max of every sensor, all worked out in one pass.  Buckets line up with local time,
+so a 1d bucket runs midnight to midnight.
+
+Output is either gzip compressed CSV or a NumPy .npz file with one array per column.  The .npz is written without
+needing NumPy on the Pi.  Each column is streamed to a temporary file first and then copied into the .npz.
+
+Examples:
+    python3 coopexport.py readings --start 2020-12-01 --end 2020-12-08 -o week.csv.gz
+    python3 coopexport.py readings --every 1h --format npz -o hourly.npz
+    python3 coopexport.py events --start "2020-12-04 06:00"
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.  NumPy is only needed to load the .npz files afterwards.
+"""
+
+import argparse
+import array
+import csv
+import datetime
+import gzip
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+import eventlog
+import statebus
+
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+LOG_FILES = {'readings': 'coop_readings.log', 'events': 'coop_events.log'}
+
+# Reading names match those control.py publishes on the state bus, without the *_time fields.
+READING_FIELDS = tuple(f for f in statebus.SENSOR_FIELDS if not f.endswith('_time'))
+
+BUCKETS = {'1min': 60, '1h': 3600, '1d': 86400}
+
+EVENT_WIDTH = 24  # Characters kept of each event name in a .npz.
+CHUNK_ROWS = 4096  # Rows held per column before writing them to the temporary file.
+
+
+def read_records(path, start=None, end=None):
+    """Function yields the records of the log at path, oldest first, with start <= ts < end."""
+    for filename in eventlog.log_files(path):
+        rotated = _rotated_time(path, filename)
+        if start is not None and rotated is not None and rotated < start:
+            continue  # Every record in this file is from before it was rotated.
+        with open(filename, 'rb', buffering=1024 * 1024) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Partial line left by a power cut.
+                ts = record.get('ts')
+                if ts is None or (start is not None and ts < start):
+                    continue
+                if end is not None and ts >= end:
+                    return
+                yield record
+
+
+def _rotated_time(path, filename):
+    """Returns when a rotated log file was rotated, or None for the active file."""
+    suffix = filename[len(path) + 1:]
+    try:
+        return time.mktime(time.strptime(suffix[:15], '%Y%m%d-%H%M%S'))
+    except ValueError:
+        return None
+
+
+def reading_rows(records):
+    """Function yields (ts, reading, ...) rows with NaN for readings a record doesn't have."""
+    for record in records:
+        if record.get('event') != 'reading':
+            continue
+        row = [record['ts']]
+        for field in READING_FIELDS:
+            value = record.get(field)
+            row.append(math.nan if value is None else float(value))
+        yield row
+
+
+def downsample(rows, seconds):
+    """Function groups reading rows into buckets of seconds lined up with local time.
+    Yields (bucket start, count, field mean, field min, field max, ...) rows, one pass and one bucket in memory."""
+    size = len(READING_FIELDS)
+    bucket = None
+    for row in rows:
+        ts = row[0]
+        offset = time.localtime(ts).tm_gmtoff
+        key = (ts + offset) // seconds
+        if key != bucket:
+            if bucket is not None:
+                yield _bucket_row(start, count, sums, counts, mins, maxs)
+            bucket = key
+            start = key * seconds - offset
+            count = 0
+            sums = [0.0] * size
+            counts = [0] * size
+            mins = [math.inf] * size
+            maxs = [-math.inf] * size
+        count += 1
+        for i in range(size):
+            value = row[i + 1]
+            if value == value:  # Skip NaN.
+                sums[i] += value
+                counts[i] += 1
+                if value < mins[i]:
+                    mins[i] = value
+                if value > maxs[i]:
+                    maxs[i] = value
+    if bucket is not None:
+        yield _bucket_row(start, count, sums, counts, mins, maxs)
+
+
+def _bucket_row(start, count, sums, counts, mins, maxs):
+    row = [start, float(count)]
+    for i in range(len(sums)):
+        if counts[i]:
+            row.extend((sums[i] / counts[i], mins[i], maxs[i]))
+        else:
+            row.extend((math.nan, math.nan, math.nan))
+    return row
+
+
+def event_rows(records):
+    """Function yields (ts, event, details) rows.  details holds any other fields as JSON."""
+    for record in records:
+        details = {k: v for k, v in record.items() if k not in ('ts', 'time', 'event')}
+        yield [record['ts'], str(record.get('event', '')), json.dumps(details, separators=(',', ':'), default=str)]
+
+
+def write_csv(output, columns, rows):
+    """Function writes rows to a CSV file, gzip compressed if output ends in .gz.  A local time column is added after
+    ts.  NaN is written as an empty cell.  Returns the number of rows written."""
+    opener = gzip.open if output.endswith('.gz') else open
+    count = 0
+    with opener(output, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([columns[0][0], 'time'] + [name for name, kind in columns[1:]])
+        for row in rows:
+            local = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row[0]))
+            writer.writerow([row[0], local] + ['' if v != v else v for v in row[1:]])
+            count += 1
+    return count
+
+
+def write_npz(output, columns, rows, compress=True):
+    """Function writes rows to a NumPy .npz file with one array per column.  Returns the number of rows written.
+    Columns are (name, kind) where kind is 'f8' or 'str'.  String columns only keep EVENT_WIDTH characters."""
+    count = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as tmp:
+        files = [open(os.path.join(tmp, name), 'wb') for name, kind in columns]
+        try:
+            chunks = [_new_chunk(kind) for name, kind in columns]
+            for row in rows:
+                for i, value in enumerate(row):
+                    if columns[i][1] == 'str':
+                        chunks[i] += value[:EVENT_WIDTH].ljust(EVENT_WIDTH, '\0').encode('utf-32-le')
+                    else:
+                        chunks[i].append(value)
+                count += 1
+                if count % CHUNK_ROWS == 0:
+                    chunks = _write_chunks(files, chunks, columns)
+            _write_chunks(files, chunks, columns)
+        finally:
+            for f in files:
+                f.close()
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        with zipfile.ZipFile(output, 'w', method) as npz:
+            for name, kind in columns:
+                descr = '<U%d' % EVENT_WIDTH if kind == 'str' else '<f8'
+                with npz.open(name + '.npy', 'w', force_zip64=True) as member:
+                    member.write(_npy_header(descr, count))
+                    with open(os.path.join(tmp, name), 'rb') as f:
+                        shutil.copyfileobj(f, member, 1024 * 1024)
+    return count
+
+
+def _new_chunk(kind):
+    return bytearray() if kind == 'str' else array.array('d')
+
+
+def _write_chunks(files, chunks, columns):
+    for f, chunk in zip(files, chunks):
+        if isinstance(chunk, array.array):
+            if sys.byteorder == 'big':
+                chunk.byteswap()
+            chunk.tofile(f)
+        else:
+            f.write(chunk)
+    return [_new_chunk(kind) for name, kind in columns]
+
+
+def _npy_header(descr, length):
+    """Returns a version 1.0 .npy header for a 1-D array."""
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, length)
+    pad = 64 - (10 + len(header) + 1) % 64
+    header = (header + ' ' * pad + '\n').encode('latin1')
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header
+
+
+def parse_time(text):
+    """Function turns a local 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM' into seconds since the epoch."""
+    for layout in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(text, layout).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('expected YYYY-MM-DD or "YYYY-MM-DD HH:MM", got ' + repr(text))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export recorded coop readings or events.')
+    parser.add_argument('kind', choices=sorted(LOG_FILES), help='what to export')
+    parser.add_argument('--start', type=parse_time, help='first local date/time to include')
+    parser.add_argument('--end', type=parse_time, help='local date/time to stop before')
+    parser.add_argument('--every', choices=list(BUCKETS), help='downsample readings to mean/min/max buckets')
+    parser.add_argument('--format', choices=('csv', 'npz'), default='csv', help='output format, default csv')
+    parser.add_argument('--log', help='log file to read, default logs/' + LOG_FILES['readings'] + ' or ' +
+                                      LOG_FILES['events'])
+    parser.add_argument('--no-compress', action='store_true', help='write .npz without compression')
+    parser.add_argument('-o', '--output', help='output file, default coop_<kind>.csv.gz or coop_<kind>.npz')
+    args = parser.parse_args(argv)
+    if args.every and args.kind != 'readings':
+        parser.error('--every can only be used with readings')
+
+    path = args.log or os.path.join(LOG_DIR, LOG_FILES[args.kind])
+    output = args.output or 'coop_%s.%s' % (args.kind, 'npz' if args.format == 'npz' else 'csv.gz')
+    records = read_records(path, args.start, args.end)
+    if args.kind == 'events':
+        columns = [('ts', 'f8'), ('event', 'str'), ('details', 'str')]
+        rows = event_rows(records)
+        if args.format == 'npz':
+            columns = columns[:2]
+            rows = (row[:2] for row in rows)  # Free form details don't fit a fixed width array.
+    elif args.every:
+        columns = [('ts', 'f8'), ('count', 'f8')]
+        for field in READING_FIELDS:
+            columns.extend(((field + '_mean', 'f8'), (field + '_min', 'f8'), (field + '_max', 'f8')))
+        rows = downsample(reading_rows(records), BUCKETS[args.every])
+    else:
+        columns = [('ts', 'f8')] + [(field, 'f8') for field in READING_FIELDS]
+        rows = reading_rows(records)
+
+    if args.format == 'npz':
+        count = write_npz(output, columns, rows, compress=not args.no_compress)
+    else:
+        count = write_csv(output, columns, rows)
+    print('Exported %d rows to %s' % (count, output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+coopstate.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+Saves a small snapshot of the coop state (door position, schedule on/off and light relay) so that main.py can pick
+up where it left off after a reboot or power cut.
+
+The snapshot is a few bytes of JSON.  It is written to a temporary file first and then moved over the old snapshot
+with os.replace, so a power cut part way through a write leaves either the old or the new snapshot, never half of one.
+Nothing is written if the state has not changed since the last save.
+
+missed_door_event works out if a scheduled opening or closing fell due between the snapshot and startup, e.g. the
+Pi comes back at 10:00 after being off overnight with the door closed, so the door needs opening straight away.
+If nothing was due while the Pi was down the door is left where it is.
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+
+
+STATE_VERSION = 1
+
+# Door positions stored in the snapshot.
+DOOR_OPEN = 'open'
+DOOR_CLOSED = 'closed'
+DOOR_STOPPED = 'stopped'
+DOOR_UNKNOWN = 'unknown'
+
+
+class StateFile:
+    def __init__(self, path):
+        self.path = path
+        self._saved = None
+        self._lock = threading.Lock()  # Door travel results are saved from a background thread.
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def load(self):
+        """Function returns the saved state as a dictionary, or None if there is no usable snapshot."""
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            return None
+        self._saved = {k: v for k, v in state.items() if k != 'ts'}
+        return state
+
+    def save(self, **state):
+        """Function saves the state if it has changed since the last save.  Returns True if a write was made."""
+        state['version'] = STATE_VERSION
+        with self._lock:
+            if state == self._saved:
+                return False
+            snapshot = dict(state, ts=round(time.time(), 3))
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+            self._saved = state
+        return True
+
+
+def _fsync_dir(directory):
+    """Makes sure the rename itself has reached the card."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def missed_door_event(door, opentime, closetime, saved, now=None):
+    """Function works out if a scheduled opening or closing fell between saved (the snapshot's ts) and now, i.e. it
+    was due while the Pi was down.  opentime and closetime are 'HH:MM' strings as made by astral_update.
+    Only the latest missed event counts.  Returns 'open' or 'close' if the door needs moving to catch up on it,
+    otherwise None.  A door moved by hand, stopped part way or in an unknown position is left alone unless a
+    scheduled event was missed."""
+    if saved is None:
+        return None
+    if now is None:
+        now = datetime.datetime.now()
+    since = datetime.datetime.fromtimestamp(saved)
+    latest = None
+    # The latest event is always within the last two days, no matter how long the Pi was down.
+    day = max(since.date(), now.date() - datetime.timedelta(days=1))
+    while day <= now.date():
+        for action, hhmm in (('open', opentime), ('close', closetime)):
+            hour, minute = (int(part) for part in hhmm.split(':'))
+            when = datetime.datetime.combine(day, datetime.time(hour, minute))
+            if since < when <= now and (latest is None or when > latest[0]):
+                latest = (when, action)
+        day += datetime.timedelta(days=1)
+    if latest is None:
+        return None
+    action = latest[1]
+    if door == (DOOR_OPEN if action == 'open' else DOOR_CLOSED):
+        return None
+    return action
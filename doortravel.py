@@ -0,0 +1,197 @@
+"""
+doortravel.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+Current sensing end of travel detection for the coop door actuator.
+
+Without it the actuator is driven blindly.  It runs until stop_door is called or it hits its internal limit, and the
+L298 keeps burning battery the whole time.  CurrentSensingDoor watches an INA260 on the motor supply while the door
+is moving and cuts the motor as soon as the door has finished:
+
+- A current drop means the actuator's internal limit switch has opened (end of travel).
+- A current spike means the actuator has stalled, either at the end of its stroke or against something in the way.
+
+The first inrush_time seconds of every run are ignored so the starting surge isn't mistaken for a stall.  A reading
+has to stay past a threshold for confirm_samples samples in a row, which at 200 samples a second cuts the motor
+within about 15ms.  The time each direction takes is learned as it runs.  If the actuator stalls well before the
+usual travel time it is flagged as an obstruction.  max_travel stops the motor regardless if nothing is detected, and
+the motor is stopped straight away with reason 'sensor_error' if the INA260 can't be read.
+
+read_current, clock and sleep can all be swapped out.  SimulatedActuator plays back a made up current profile so the
+detection can be tried on the bench without any hardware, e.g.
+
+    sim = SimulatedActuator([(0.2, 2500), (12.0, 900), (99, 4000)])
+    door = CurrentSensingDoor(sim, sim.read_current, clock=sim.clock, sleep=sim.sleep)
+    door.run('open')     # {'direction': 'open', 'reason': 'stall', 'seconds': 12.011, ...}
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+adafruit-circuitpython-ina260 (only for ina260_reader).
+"""
+
+import threading
+import time
+
+
+OPEN = 'open'
+CLOSE = 'close'
+
+
+class CurrentSensingDoor:
+    def __init__(self, motor, read_current, sample_rate=200, inrush_time=0.3, stall_current=3000, end_current=100,
+                 confirm_samples=3, max_travel=60, obstruction_fraction=0.8, travel_time=None, learn_weight=0.25,
+                 on_finish=None, clock=time.monotonic, sleep=time.sleep):
+        """motor is a gpiozero Motor (anything with forward, backward and stop).  read_current returns the motor
+        supply current in mA.  stall_current and end_current are the mA either side of normal running current.
+        travel_time is a dictionary of the usual seconds for 'open' and 'close', learned if not given.
+        on_finish is called with the result dictionary whenever a run ends."""
+        self.motor = motor
+        self.read_current = read_current
+        self.sample_period = 1.0 / sample_rate
+        self.inrush_time = inrush_time
+        self.stall_current = stall_current
+        self.end_current = end_current
+        self.confirm_samples = confirm_samples
+        self.max_travel = max_travel
+        self.obstruction_fraction = obstruction_fraction
+        self.travel_time = dict(travel_time or {})
+        self.learn_weight = learn_weight
+        self.on_finish = on_finish
+        self.clock = clock
+        self.sleep = sleep
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def open(self):
+        """Function starts opening the door in the background."""
+        self._start(OPEN)
+
+    def close(self):
+        """Function starts closing the door in the background."""
+        self._start(CLOSE)
+
+    def stop(self):
+        """Function stops the door straight away and ends any run in progress."""
+        self._cancel.set()
+        self.motor.stop()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _start(self, direction):
+        self.stop()
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self.run, args=(direction,), name='DoorTravel', daemon=True)
+        self._thread.start()
+
+    def run(self, direction):
+        """Function drives the door in direction ('open' or 'close') until end of travel is detected.
+        Blocks until the motor has been stopped and returns a result dictionary."""
+        if direction == OPEN:
+            self.motor.forward()
+        else:
+            self.motor.backward()
+        start = self.clock()
+        next_sample = start
+        high = low = 0
+        peak = 0.0
+        reason = 'timeout'
+        try:
+            while True:
+                if self._cancel.is_set():
+                    reason = 'stopped'
+                    break
+                now = self.clock()
+                elapsed = now - start
+                if elapsed >= self.max_travel:
+                    break
+                try:
+                    current = abs(self.read_current())
+                except Exception:  # An I2C NAK or bus error, see sensorread.py.
+                    reason = 'sensor_error'  # Can't tell where the door is, stop rather than drive it blind.
+                    break
+                if elapsed >= self.inrush_time:
+                    peak = max(peak, current)
+                    high = high + 1 if current >= self.stall_current else 0
+                    low = low + 1 if current <= self.end_current else 0
+                    if high >= self.confirm_samples:
+                        reason = 'stall'
+                        break
+                    if low >= self.confirm_samples:
+                        reason = 'end'
+                        break
+                next_sample += self.sample_period
+                delay = next_sample - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+                else:
+                    next_sample = self.clock()  # Fell behind, don't try and catch up with a burst of reads.
+        finally:
+            self.motor.stop()  # Whatever happens the motor is never left running.
+        seconds = self.clock() - start
+        usual = self.travel_time.get(direction)
+        obstruction = (reason == 'stall' and usual is not None and seconds < usual * self.obstruction_fraction)
+        if reason in ('stall', 'end') and not obstruction:
+            if usual is None:
+                self.travel_time[direction] = round(seconds, 3)
+            else:
+                self.travel_time[direction] = round(usual + (seconds - usual) * self.learn_weight, 3)
+        result = {'direction': direction, 'reason': reason, 'seconds': round(seconds, 3), 'peak_current': peak,
+                  'obstruction': obstruction, 'travel_time': self.travel_time.get(direction)}
+        if self.on_finish is not None:
+            self.on_finish(result)
+        return result
+
+
+def ina260_reader(address):
+    """Function sets up an INA260 for fast sampling and returns a function that reads its current in mA."""
+    import board
+    from adafruit_ina260 import INA260, Mode, AveragingCount, ConversionTime
+    ina260 = INA260(board.I2C(), address)
+    ina260.averaging_count = AveragingCount.COUNT_1
+    ina260.current_conversion_time = ConversionTime.TIME_140_us
+    ina260.mode = Mode.CONTINUOUS
+
+    def read_current():
+        return ina260.current
+    return read_current
+
+
+class SimulatedActuator:
+    """Stands in for the motor, INA260 and clock.  profile is a list of (until_seconds, mA) pairs measured from when
+    the motor starts.  Time only moves on when sleep is called, so a run finishes instantly."""
+
+    def __init__(self, profile, read_time=0.001):
+        self.profile = profile
+        self.read_time = read_time
+        self.now = 0.0
+        self.started = None
+        self.running = False
+
+    def forward(self):
+        self.started = self.now
+        self.running = True
+
+    backward = forward
+
+    def stop(self):
+        self.running = False
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def read_current(self):
+        self.now += self.read_time
+        if not self.running:
+            return 0.0
+        elapsed = self.now - self.started
+        for until, current in self.profile:
+            if elapsed < until:
+                return current
+        return 0.0
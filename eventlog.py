@@ -0,0 +1,173 @@
+"""
+eventlog.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+A small buffered event log for recording what the coop did and when.  Door open/close/stop, schedule override
+toggles, light relay changes and the daily astral times are written as one JSON record per line.
+
+The Pi runs from an SD card, so records are held in memory and written out in batches.  A batch is written when
+the buffer fills up, when flush_interval seconds have passed since the last write, or straight away when a
+critical event (such as the door moving) is logged.  This keeps a full history without a write on every event.
+
+Log files are rotated when they grow past max_bytes or when the day changes.  Rotated files keep the same name
+with the rotation date/time added on the end, e.g. coop_events.log.20201204-000012, so they sort oldest to newest.
+
+Example:
+    eventLog = EventLog('logs/coop_events.log')
+    eventLog.log('door_open', source='schedule')
+    eventLog.tail(5, event='door_open')
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import atexit
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+
+
+# Events that are written to the card as soon as they are logged.
+CRITICAL_EVENTS = ('door_open', 'door_close', 'door_stop', 'schedule_on', 'schedule_off')
+
+
+class EventLog:
+    def __init__(self, path, max_bytes=1024 * 1024, flush_interval=300, max_buffered=64,
+                 critical_events=CRITICAL_EVENTS):
+        """path is the active log file.  max_bytes is the size a file may grow to before it is rotated.
+        flush_interval is the most seconds a record will sit in memory.  max_buffered is the number of records
+        held before a batch is written regardless of time."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.critical_events = frozenset(critical_events)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)  # Never lose the last batch on a normal exit.
+
+    def log(self, event, critical=None, **fields):
+        """Function adds a record to the buffer.  Any keyword arguments are stored with the record.
+        Critical events, or critical=True, flush the buffer straight away."""
+        now = time.time()
+        record = {'ts': round(now, 3),
+                  'time': datetime.datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+                  'event': event}
+        record.update(fields)
+        if critical is None:
+            critical = event in self.critical_events
+        with self._lock:
+            self._buffer.append(json.dumps(record, separators=(',', ':'), default=str))
+            if critical or len(self._buffer) >= self.max_buffered:
+                self._write_buffer()
+        return record
+
+    def flush(self):
+        """Function writes any buffered records to the log file."""
+        with self._lock:
+            self._write_buffer()
+
+    def flush_if_due(self):
+        """Function is cheap enough to call on every pass of a main loop.  Only writes once flush_interval has passed."""
+        if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        self.flush()
+
+    def _write_buffer(self):
+        """Writes the buffer as a single append.  Caller must hold the lock."""
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        data = ('\n'.join(self._buffer) + '\n').encode('utf-8')
+        self._rotate_if_needed(len(data))
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+
+    def _rotate_if_needed(self, incoming):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_size == 0:
+            return
+        file_day = datetime.date.fromtimestamp(st.st_mtime)
+        if st.st_size + incoming <= self.max_bytes and file_day == datetime.date.today():
+            return
+        rotated = self.path + '.' + datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        # Rotated twice in the same second, add a zero padded counter so the names still sort oldest to newest.
+        count = 1
+        while os.path.exists(rotated + ('' if count == 1 else '-%03d' % count)):
+            count += 1
+        os.replace(self.path, rotated + ('' if count == 1 else '-%03d' % count))
+
+    def log_files(self):
+        """Function returns every log file for this log, oldest first.  The active file is always last."""
+        return log_files(self.path)
+
+    def tail(self, count=10, event=None):
+        """Function returns the last count records, oldest first, optionally only those matching event.
+        Files are read backwards from the end so a large log is never read in full."""
+        with self._lock:
+            pending = list(self._buffer)
+        found = []
+        for line in reversed(pending):
+            record = json.loads(line)
+            if event is None or record['event'] == event:
+                found.append(record)
+                if len(found) >= count:
+                    return found[::-1]
+        for path in reversed(self.log_files()):
+            for line in _reverse_lines(path):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Partial line left by a power cut.
+                if event is None or record.get('event') == event:
+                    found.append(record)
+                    if len(found) >= count:
+                        return found[::-1]
+        return found[::-1]
+
+
+def log_files(path):
+    """Function returns the active log file at path and all of its rotated files, oldest first."""
+    files = sorted(glob.glob(glob.escape(path) + '.*'))
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _reverse_lines(path, block_size=4096):
+    """Yields the lines of a file last line first, reading it from the end in blocks."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            block = f.read(step) + remainder
+            lines = block.split(b'\n')
+            remainder = lines.pop(0)  # May be the end of a line that started in an earlier block.
+            for line in reversed(lines):
+                if line:
+                    yield line.decode('utf-8', 'replace')
+        if remainder:
+            yield remainder.decode('utf-8', 'replace')
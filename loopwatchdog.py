@@ -0,0 +1,124 @@
+"""
+loopwatchdog.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+A watchdog thread for the main loops in main.py and control.py.  A blocking call (a time.sleep in a door function,
+a hung AM2320 read or a slow LCD redraw) will freeze a main loop without leaving any trace of why.
+
+The main loop calls kick() once per pass, which only stores the time.  The watchdog thread checks in the background
+and if a pass runs longer than the budget it grabs the stack of every thread using sys._current_frames, so you can
+see exactly where the loop was stuck.  When the loop gets going again the length of the stall is reported as well.
+
+If the script is run as a systemd service with WatchdogSec= set, the watchdog also pings systemd for as long as the
+main loop is healthy.  If the loop stays stuck systemd stops getting pinged and will restart the service.
+
+Example:
+    loopWatchdog = LoopWatchdog(10, on_stall=report_stall)
+    loopWatchdog.start()
+    while True:
+        loopWatchdog.kick()
+        ...
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopWatchdog(threading.Thread):
+    def __init__(self, budget, on_stall=None, check_interval=None, systemd=True, history=10):
+        """budget is the most seconds one pass of the main loop should take.
+        on_stall is called with a stall dictionary once when a stall is found and again when the loop recovers."""
+        threading.Thread.__init__(self, name='LoopWatchdog', daemon=True)
+        self.budget = budget
+        self.on_stall = on_stall
+        self.check_interval = check_interval or budget / 4.0
+        self.history = history
+        self.stalls = []  # The last few stalls, newest last.
+        self._last_kick = time.monotonic()
+        self._stop_event = threading.Event()
+        self._notify_socket = _systemd_socket() if systemd else None
+        if self._notify_socket is not None:
+            usec = os.environ.get('WATCHDOG_USEC')
+            if usec:
+                # systemd wants pinging at least twice per WatchdogSec.
+                self.check_interval = min(self.check_interval, int(usec) / 2000000.0)
+
+    def kick(self):
+        """Function called once at the start of every pass of the main loop."""
+        self._last_kick = time.monotonic()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        self._notify('READY=1')
+        stall = None
+        while not self._stop_event.wait(self.check_interval):
+            last_kick = self._last_kick
+            now = time.monotonic()
+            if stall is not None:
+                if last_kick != stall['kick']:
+                    # Loop has moved on.  The stalled pass ran from the old kick up to the new one.
+                    stall['seconds'] = round(last_kick - stall['kick'], 3)
+                    stall['ended'] = True
+                    self._report(stall)
+                    stall = None
+                else:
+                    continue  # Still stuck, stop pinging systemd.
+            if now - last_kick > self.budget:
+                stall = {'kick': last_kick, 'started': time.time() - (now - last_kick),
+                         'seconds': round(now - last_kick, 3), 'ended': False, 'stacks': thread_stacks()}
+                self.stalls.append(stall)
+                del self.stalls[:-self.history]
+                self._report(stall)
+            else:
+                self._notify('WATCHDOG=1')
+
+    def _report(self, stall):
+        if self.on_stall is None:
+            return
+        try:
+            self.on_stall(stall)
+        except Exception:
+            traceback.print_exc()  # A bad callback must not kill the watchdog.
+
+    def _notify(self, message):
+        if self._notify_socket is None:
+            return
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as s:
+                s.sendto(message.encode('ascii'), self._notify_socket)
+        except OSError:
+            pass
+
+
+def thread_stacks():
+    """Function returns a dictionary of thread name to formatted stack for every running thread."""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = {}
+    for ident, frame in sys._current_frames().items():
+        name = '%s (%d)' % (names.get(ident, 'unknown'), ident)
+        stacks[name] = ''.join(traceback.format_stack(frame))
+    return stacks
+
+
+def _systemd_socket():
+    """Returns the address of systemd's notify socket, or None if not running under systemd."""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return None
+    if address.startswith('@'):
+        address = '\0' + address[1:]  # Abstract namespace socket.
+    return address
@@ -34,57 +34,83 @@ the coop.
 
 12/04/2020 - Added interior lights to scheduling to come on X number of minutes before coop door closes.
              The turn off when the door closes.
-"""
 
-# TODO: Consider adding some form of logging to record opening and closing date/time.
-# Todo: Look into function "set_coop_light_relay" to see if needed or not under current programming.
+10/19/2026 - Added event logging using eventlog.py.  Door open/close/stop, schedule override, light relay changes and
+             the daily astral times are recorded to logs/coop_events.log.  Records are buffered and written in
+             batches to save wear on the SD card, door and schedule events are written straight away.
+             Fixed astral_update not updating the global interiorlights time.
+
+10/19/2026 - Added a state snapshot using coopstate.py.  Door position, useSchedule and the light relay are saved to
+             logs/coop_state.json whenever they change and restored on startup.  If the door missed a scheduled
+             opening or closing while the Pi was down it is now opened or closed straight away.
+
+10/19/2026 - Added a main loop watchdog using loopwatchdog.py.  If one pass of main_loop takes longer than
+             loopBudget seconds the stacks of all threads are saved to the event log along with how long the
+             stall lasted.  Pings the systemd watchdog when run as a service with WatchdogSec= set.
+
+10/19/2026 - Added an on-demand sampling profiler using profiler.py.  Send SIGUSR1 to start profiling and again to
+             stop.  A flame graph compatible profile is written to the logs folder.
+
+10/19/2026 - Added current sensing end of travel detection using doortravel.py.  With currentSensing set True an
+             INA260 on the motor supply is sampled while the door moves and the motor is cut as soon as the door
+             reaches the end of travel or stalls.  Travel times are learned and saved with the coop state, and a
+             stall well short of the usual travel time is logged as an obstruction.
+
+10/19/2026 - Added a shared memory state bus using statebus.py.  Door position, useSchedule, the light relay and the
+             daily times are published for control.py and any other coop process to read.
+
+10/19/2026 - One Pi can now run several coops.  The door and lights logic has moved to coop.py and each coop is set
+             up from its own section of coops.ini with its own pins, location, sun event offsets and schedule
+             override.  All coops share one scheduler and one event loop.  Buttons are now handled by gpiozero
+             callbacks that queue their action for the event loop, so the loop only wakes for a button press or
+             the next scheduled job instead of polling every second.  Each coop's times are now worked out again
+             and rescheduled at 00:01, the old 12:01 update never rescheduled the door.
+"""
 
-from gpiozero import Button, Motor, LED
-import gpiozero
 import schedule
-import time
 import datetime
-from datetime import date
-from astral import LocationInfo
-from astral.sun import sun
-import pytz
+import configparser
+import queue
+import signal
 import sys
+import os
+import traceback
+import eventlog
+import loopwatchdog
+import profiler
+import statebus
+import coop
 
 
-#  GPIO pins used
-buttonOpen = Button(18)  # GPIO for open button.
-buttonClose = Button(23)  # GPIO for close button.
-buttonStop = Button(24)
-motor = Motor(14, 15)  # First GPIO is open, second is close.
-buttonSchedOverride = Button(25)  # Override the scheduled opening/closing of coop door.
-ledSchedOff = LED(4)  # Use LED to indicate that coop door is in override mode.
+# Each section of the config file is a coop.  See coops.ini and coop.py.
+configFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coops.ini')
+coops = []  # A CoopController for each coop, filled in by load_coops.
 
-#  GPIO button used to toggle Light relay.
-lightsOnRelay = 21  # Coop light relay pin
-lightOnButton = Button(17)  # Coop light button.
+# Button presses from every coop are queued here and run by main_loop.
+actions = queue.Queue()
 
-# create a relay object.
-# Check the specs on relay.  Some turn on when gpio port is set low, while others need to be set high.
-# I use SainSmart 5v Relays and although they say on is "low" i've found I need to set high.
-# Additionally, i've found the "initial_value" needs to be set True in order to have them off on startup.
-coopLightRelay = gpiozero.OutputDevice(lightsOnRelay, active_high=True, initial_value=True)
+# Set to True will turn on debug printing to console.
+debug = True
 
-# Initiate variables for astral_update function.
-opentime = 0
-closetime = 0
-interiorlights = 0
+# Event log used to record door, schedule and lighting events for every coop.  See eventlog.py for details.
+eventLogFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'coop_events.log')
+eventLog = eventlog.EventLog(eventLogFile)
 
-#  Check if scheduled coop door should be run.  If True the dawn/dusk schedule will be run.
-#  If False the door will have to be manually opened and closed.
-useSchedule = True
+# Shared memory state bus read by control.py.  main.py is the only writer of the door sections.  See statebus.py.
+try:
+    stateBus = statebus.StateBus()
+except (RuntimeError, OSError) as error:
+    print('State bus not available: ' + str(error))
+    stateBus = None
 
-# Set to True will turn on debug printing to console.
-debug = True
+# Most seconds a single pass of main_loop should take before it's treated as a stall.  See loopwatchdog.py.
+loopBudget = 10
+
+# Seconds a profile started with SIGUSR1 runs for if it isn't stopped first.  See profiler.py.
+profileWindow = 60
 
-# Check if we want to turn interior lights on X number of minutes before coop door closes. We will turn off the lights
-# when the coop door closes.
-interiorLights = True
-lightMinutes = 10  # Time when lights come on before coop door closes.
+# Time each morning the coops' open/close times are worked out again for the new day.
+refreshTime = '00:01'
 
 
 def current_time():
@@ -98,124 +124,88 @@ def debug_print(message):
         print(message)
 
 
-def open_door():
-    motor.forward()
-    debug_print("Door opened ")
-    time.sleep(1)
-
-
-def close_door():
-    motor.backward()
-    debug_print("Door closed ")
-    time.sleep(1)
-    if interiorLights:
-        interior_lights_on_off()
-
-
-def stop_door():
-    motor.stop()
-    debug_print("Door stopped ")
-    time.sleep(1)
-    
-
-def interior_lights_on_off():
-    # Function checks if interiorLights is True. If so will be used to toggle interior lights on and off.
-    if interiorLights:
-        coopLightRelay.toggle()
-        debug_print("Toggled lights ")
-
-
-def astral_update():
-    """Function grabs sunrise and dusk using your location and creates a schedule of events
-        You can change your location by modifying the fourth line of function.
-        You may specify alternate open and close times by modifying opentime and closetime.
-        Valid options are dawn, sunrise, sunset and dusk."""
-    global opentime
-    global closetime
-    # astral.Location format is: City, Country, Long, Lat, Time Zone, elevation.
-    city = LocationInfo('lincoln city', 'USA', 'US/Pacific', 45.014, -123.909)
-    s = sun(city.observer, date=date.today(), tzinfo=pytz.timezone(city.timezone))
-    opentime = (str(s['sunrise'].isoformat())[11:16])  # Strips date.time to just the time.
-    interiorlights = (s['dusk'] - datetime.timedelta(minutes=lightMinutes))  # Calculate lights on time bofore door closing time
-    interiorlights = (str(interiorlights.isoformat())[11:16])  # Convert "lightson" datetime to just time.
-    closetime = (str(s['dusk'].isoformat())[11:16])
-    return opentime, closetime, interiorlights
-
-
-def door_schedule():
-    """Function for scheduled opening and closing of coop door."""
-    global opentime
-    global closetime
-    schedule.every().day.at(opentime).do(open_door)
-    schedule.every().day.at(closetime).do(close_door)
-    debug_print('Open Time: ' + str(opentime))
-    debug_print('Close Time: ' + str(closetime))
-
-
-def interior_light_schedule():
-    """Function to schedule interior lights on before the door closes"""
-    global interiorlights
-    schedule.every().day.at(interiorlights).do(interior_lights_on_off)
-    debug_print("Lights come on: " + str(interiorLights))
-
-
-def scheduling_off():
-    global useSchedule
-    debug_print('Schedule Off at: ')
-    ledSchedOff.on()  # Turn on schedule LED.
-    useSchedule = False  # Turn off Scheduling.
-
-
-def scheduling_on():
-    global useSchedule
-    debug_print('Schedule On at: ')
-    ledSchedOff.off()  # Turn off schedule LED.
-    useSchedule = True  # Turn on Scheduling.
-
-
-def set_coop_light_relay(status):
-    """Function called to set the initial state of the light relay.  Under current programing should always be False."""
-    if status:
-        debug_print('Setting relay: ON ')
-        coopLightRelay.on()
+def load_coops(path):
+    """Function creates a CoopController for each section of the config file."""
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise RuntimeError('No coop configuration found at ' + path)
+    if len(config.sections()) > statebus.MAX_COOPS:
+        raise RuntimeError('Only ' + str(statebus.MAX_COOPS) + ' coops can be run from one Pi')
+    for index, name in enumerate(config.sections()):
+        coops.append(coop.CoopController(name, config[name], eventLog, os.path.dirname(eventLogFile),
+                                         state_bus=stateBus, bus_index=index, debug=debug))
+
+
+def refresh_coops():
+    """Function updates every coop's times for the new day and reschedules them."""
+    for c in coops:
+        c.refresh()
+
+
+def report_stall(stall):
+    """Function called by the loop watchdog when main_loop stalls and again when it recovers."""
+    if stall['ended']:
+        debug_print('Main loop recovered after ' + str(stall['seconds']) + ' seconds')
+        eventLog.log('stall_end', critical=True, seconds=stall['seconds'])
     else:
-        debug_print('Setting relay: OFF ')
-        coopLightRelay.off()
+        debug_print('Main loop stalled for ' + str(stall['seconds']) + ' seconds')
+        eventLog.log('stall', critical=True, seconds=stall['seconds'], stacks=stall['stacks'])
+
+
+def profile_written(path, samples):
+    """Function called by the profiler once a profile has been written."""
+    debug_print('Profile written to ' + path)
+    eventLog.log('profile', path=path, samples=samples)
+
+
+def run_action(action):
+    """Function runs a queued or scheduled action.  The loop serves every coop, so an error is logged instead of
+    stopping the loop."""
+    try:
+        action()
+    except Exception:
+        owner = getattr(action, '__self__', None)
+        if isinstance(owner, coop.CoopController):
+            owner.log_error(action)
+        else:
+            debug_print('Error in ' + action.__name__ + ': ' + traceback.format_exc())
+            eventLog.log('action_error', critical=True, action=action.__name__, error=traceback.format_exc())
 
 
-def button_coop_light_relay():
-    """Function called to turn on/off the light on relay when button is pressed"""
-    debug_print('toggling relay ')
-    coopLightRelay.toggle()
+def terminate(signum, frame):
+    """Function called when systemd stops or restarts the service with SIGTERM.  Python's default would exit without
+    writing out the buffered events, so it's treated the same as Ctrl+C."""
+    raise KeyboardInterrupt
 
 
 def main_loop():
+    """Runs scheduled jobs and queued button presses for every coop.  Sleeps until the next button press or scheduled
+    job, waking at least every loopBudget / 2 seconds to keep the watchdog happy."""
+    loopWatchdog = loopwatchdog.LoopWatchdog(loopBudget, on_stall=report_stall)
+    loopWatchdog.start()
     while True:
-        if buttonOpen.is_pressed:
-            open_door()
-        if buttonClose.is_pressed:
-            close_door()
-        if buttonStop.is_pressed:
-            stop_door()
-        if buttonSchedOverride.is_pressed:  # Check if override schedule button is pressed.
-            if useSchedule:
-                scheduling_off()  # If useSchedule is True/enabled then override scheduling by turning it off.
-            else:
-                scheduling_on()  # Scheduling is already off, turn it back on.
-        if useSchedule:  # Check to see if useSchedule flag is True.  If True then check for pending schedules.
-            schedule.run_pending()
-        if lightOnButton.is_pressed:
-            button_coop_light_relay()
-        time.sleep(1)
+        loopWatchdog.kick()
+        schedule.run_pending()
+        eventLog.flush_if_due()  # Write out buffered events once the flush interval has passed.
+        idle = schedule.idle_seconds()
+        timeout = loopBudget / 2.0 if idle is None else min(max(idle, 0), loopBudget / 2.0)
+        try:
+            action = actions.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        run_action(action)
 
 
 if __name__ == "__main__":
     try:
-        astral_update()  # Initiate astral_update.  Get Astral times.
-        door_schedule()  # Initiate door_schedule
-        interior_light_schedule()  # Initiate interior light schedule.
-        schedule.every().day.at('12:01').do(astral_update)  # Run function astral_times first thing every morning...
-        # in order to update times for the new day.
+        signal.signal(signal.SIGTERM, terminate)
+        profiler.install_signal_toggle(profiler.SamplingProfiler(os.path.dirname(eventLogFile), window=profileWindow,
+                                                                 on_write=profile_written))
+        load_coops(configFile)
+        for c in coops:
+            c.start()  # Get Astral times, restore the saved state and schedule the door and lights.
+            c.connect_buttons(actions.put)
+        schedule.every().day.at(refreshTime).do(run_action, refresh_coops)  # Update times for the new day.
 
         main_loop()
     except RuntimeError as error:
@@ -225,6 +215,8 @@ if __name__ == "__main__":
     #     print(str(e))
     except KeyboardInterrupt:
         print("\nExiting application\n")
-        set_coop_light_relay(False)
+        for c in coops:
+            c.set_coop_light_relay(False)
+        eventLog.close()  # Write out any buffered events before exiting.
         # exit the application
         sys.exit(0)
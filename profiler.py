@@ -0,0 +1,105 @@
+"""
+profiler.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+An on-demand sampling profiler for finding out where the CPU goes on a running coop controller without stopping it.
+
+Send the process SIGUSR1 to start profiling and again to stop it.  If it isn't stopped it stops by itself after
+window seconds.  While running, a background thread takes a sample of every thread's stack each interval seconds
+and counts how often each stack is seen.  When profiling stops the counts are written out in the collapsed stack
+format used by flamegraph.pl and speedscope, one stack per line followed by its sample count.
+
+When profiling is off there is no thread and no hook installed, so it costs nothing.
+
+Example:
+    kill -USR1 $(pgrep -f main.py)     # Start
+    kill -USR1 $(pgrep -f main.py)     # Stop and write logs/profile-20201204-101500.folded
+    flamegraph.pl logs/profile-20201204-101500.folded > profile.svg
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import datetime
+import os
+import signal
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir, interval=0.01, window=60, on_write=None):
+        """output_dir is where profiles are written.  interval is seconds between samples.  window is the most
+        seconds a profile runs for.  on_write is called with the file path and number of samples once written."""
+        self.output_dir = output_dir
+        self.interval = interval
+        self.window = window
+        self.on_write = on_write
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Function asks the sampling thread to stop.  The thread writes the profile on its way out."""
+        self._stop_event.set()
+
+    def toggle(self, *args):
+        """Function starts or stops profiling.  Takes the (signum, frame) arguments so it can be a signal handler."""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _sample(self):
+        counts = {}
+        samples = 0
+        own = threading.get_ident()
+        deadline = time.monotonic() + self.window if self.window else None
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread-%d' % ident))
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        self._write(counts, samples)
+
+    def _write(self, counts, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir,
+                            'profile-' + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.folded')
+        with open(path, 'w') as f:
+            for stack, count in sorted(counts.items()):
+                f.write('%s %d\n' % (stack, count))
+        if self.on_write is not None:
+            self.on_write(path, samples)
+
+
+def install_signal_toggle(profiler, signum=signal.SIGUSR1):
+    """Function makes signum start and stop the profiler.  Must be called from the main thread."""
+    signal.signal(signum, profiler.toggle)
@@ -0,0 +1,138 @@
+"""
+sensorread.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+Deadline bounded sensor reads for the control panel.
+
+The AM2320 is known to NAK its first transaction while it wakes up, and a failed INA260 read used to kill the whole
+LCD cycle.  DeadlineSensor wraps a sensor read function so the caller never waits longer than the sensor's deadline:
+
+- The read runs on its own thread.  If it hasn't finished by the deadline the caller gets the last good value and
+  the read is left to finish (or not) in the background.  A sensor that is still hung isn't read again until it
+  comes back.
+- A failed read is retried a limited number of times, with the wait between tries doubling each time, as long as
+  there is time left before the deadline.
+- After failure_threshold reads in a row fail the sensor is left alone for cooldown seconds (the circuit breaker is
+  open).  Reads during that time return the last good value straight away.  After the cooldown one read is tried
+  again, if it works the sensor is back in use, if not it's left alone for another cooldown.
+
+Every read returns a Reading.  fresh is True when value came from this read.  Otherwise value is the last good value
+(None if there never was one) and age is how many seconds old it is.
+
+Example:
+    am2320Sensor = DeadlineSensor('am2320', am2320, deadline=1.0, retries=3)
+    reading = am2320Sensor.read()
+    reading.value, reading.age, reading.fresh
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import collections
+import threading
+import time
+
+
+Reading = collections.namedtuple('Reading', 'value age fresh error')
+
+
+class DeadlineSensor:
+    def __init__(self, name, read_function, deadline=0.5, retries=2, backoff=0.05, failure_threshold=3, cooldown=60,
+                 clock=time.monotonic):
+        """name is used in thread names and errors.  read_function takes no arguments and returns the reading.
+        deadline is the most seconds read() will wait.  backoff is the wait before the first retry."""
+        self.name = name
+        self.read_function = read_function
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0  # Reads in a row that have failed.
+        self._open_until = None  # Set while the circuit breaker is open.
+        self._last_value = None
+        self._last_time = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    @property
+    def broken(self):
+        """True while the circuit breaker is open and the sensor is being left alone."""
+        return self._open_until is not None and self.clock() < self._open_until
+
+    def read(self):
+        """Function returns a Reading, never taking longer than the deadline."""
+        if self.broken:
+            return self._stale('%s left alone after %d failed reads' % (self.name, self.failures))
+        if self._worker is not None and self._worker.is_alive():
+            return self._stale('%s is still busy with an earlier read' % self.name)
+        result = {}
+        done = threading.Event()
+        self._worker = threading.Thread(target=self._attempt, args=(result, done, self.clock() + self.deadline),
+                                        name='sensor-' + self.name, daemon=True)
+        self._worker.start()
+        if not done.wait(self.deadline):
+            return self._stale('%s read took longer than %s seconds' % (self.name, self.deadline))
+        if 'value' in result:
+            return Reading(result['value'], 0.0, True, None)
+        return self._stale(result['error'])
+
+    def _attempt(self, result, done, deadline):
+        """Runs on the worker thread.  Tries the read, with retries, and records the outcome."""
+        wait = self.backoff
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                value = self.read_function()
+            except Exception as e:
+                error = e
+            else:
+                self._succeeded(value)
+                result['value'] = value
+                done.set()
+                return
+            if self.clock() + wait >= deadline:
+                break  # No time left for another try.
+            time.sleep(wait)
+            wait *= 2
+        self._failed()
+        result['error'] = '%s read failed: %s' % (self.name, error)
+        done.set()
+
+    def _succeeded(self, value):
+        with self._lock:
+            self._last_value = value
+            self._last_time = self.clock()
+            self.failures = 0
+            self._open_until = None
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._open_until = self.clock() + self.cooldown
+
+    def _stale(self, error):
+        with self._lock:
+            value, taken = self._last_value, self._last_time
+        age = None if taken is None else self.clock() - taken
+        return Reading(value, age, False, error)
+
+
+def age_text(reading):
+    """Function returns a short age to show next to a reading on the LCD, e.g. '3m'.  Blank for a fresh reading."""
+    if reading.fresh:
+        return ''
+    if reading.age is None:
+        return '--'
+    if reading.age < 60:
+        return '%ds' % reading.age
+    if reading.age < 3600:
+        return '%dm' % (reading.age / 60)
+    return '%dh' % (reading.age / 3600)
@@ -0,0 +1,216 @@
+"""
+statebus.py
+Author: Mike Paxton
+Creation Date: 10/19/2026
+Python Version: 3.8 or newer
+
+Free and open for all to use.  But put credit where credit is due.
+
+OVERVIEW:-----------------------------------------------------------------------
+A small shared memory segment for passing the coop state between main.py (door) and control.py (panel) without
+either of them working things out twice.  Any coop process can attach to it and read it without a system call.
+
+The segment has a fixed layout made of a header, a door section for each coop and a sensor section.  Each section
+has a single writer:
+
+    door    - written by main.py, one per coop up to MAX_COOPS.  Coop name, door position, schedule on/off, light
+              relay and the day's open/close/light times.  Section 0 is the first coop in coops.ini.
+    sensors - written by control.py.  Latest AM2320, solar and battery INA260 and CPU readings with their times.
+
+Each section is guarded by a seqlock.  The writer bumps the section's sequence number to odd, writes the fields and
+bumps it back to even.  A reader copies the fields and only keeps the copy if the sequence number was even and the
+same before and after, otherwise it tries again.  Readers never block the writer.
+
+The segment lives in /dev/shm and is kept after the processes exit so either script can be restarted on its own.
+
+Example:
+    bus = StateBus()
+    bus.publish_door(0, name='coop', door='open', use_schedule=True)
+    bus.read_door()     # {'name': 'coop', 'door': 'open', 'use_schedule': True, ...}
+
+PYTHON LIBRARIES NEEDED:-----------------------------------------------------------
+None.  Only uses the standard library.
+"""
+
+import math
+import struct
+import threading
+import time
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7 and older.
+    shared_memory = None
+
+
+BUS_NAME = 'starclucks'
+MAGIC = b'SCB1'
+LAYOUT_VERSION = 2
+MAX_COOPS = 8
+
+HEADER = struct.Struct('<4sH2x')  # magic, layout version.
+SEQ = struct.Struct('<I')
+
+# name, door, use_schedule, relay, opentime, closetime, lightstime, updated.
+DOOR = struct.Struct('<16s8s??5s5s5sd')
+DOOR_FIELDS = ('name', 'door', 'use_schedule', 'relay', 'opentime', 'closetime', 'lightstime', 'updated')
+
+# Each reading is followed by the time it was taken.  Unknown readings are NaN.
+SENSOR_FIELDS = ('cooptemp', 'coophumidity', 'am2320_time',
+                 'solar_current', 'solar_voltage', 'solar_power', 'solar_time',
+                 'battery_current', 'battery_voltage', 'battery_power', 'battery_time',
+                 'cpu_temperature', 'cpu_time')
+SENSORS = struct.Struct('<' + 'd' * len(SENSOR_FIELDS))
+
+DOOR_OFFSET = HEADER.size
+DOOR_SIZE = SEQ.size + DOOR.size  # Each coop's door section.
+SENSOR_OFFSET = DOOR_OFFSET + DOOR_SIZE * MAX_COOPS
+BUS_SIZE = SENSOR_OFFSET + SEQ.size + SENSORS.size
+
+# A reader gives up after this many tries, in case a writer was killed part way through a write.
+READ_RETRIES = 1000
+
+# Seconds to wait for a segment another process has just created to get its header.
+ATTACH_WAIT = 1.0
+
+
+class StateBus:
+    def __init__(self, name=BUS_NAME):
+        """Attaches to the bus, creating it first if no other coop process has."""
+        if shared_memory is None:
+            raise RuntimeError('statebus needs Python 3.8 or newer')
+        self.shm = _open_segment(name)
+        self.buf = self.shm.buf
+        self._write_lock = threading.Lock()  # Keeps two threads in the same writer from interleaving.
+        self._doors = [dict(name='', door='unknown', use_schedule=False, relay=False, opentime='', closetime='',
+                            lightstime='', updated=0.0) for _ in range(MAX_COOPS)]
+        self._sensors = dict.fromkeys(SENSOR_FIELDS, math.nan)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def publish_door(self, index, **fields):
+        """Function updates coop index's door section.  Only main.py should call this.  Fields not given keep their
+        value."""
+        self._check_fields(fields, DOOR_FIELDS)
+        with self._write_lock:
+            d = self._doors[index]
+            d.update(fields, updated=time.time())
+            values = (d['name'].encode('utf-8')[:16], d['door'].encode('ascii'), bool(d['use_schedule']),
+                      bool(d['relay']), str(d['opentime']).encode('ascii'), str(d['closetime']).encode('ascii'),
+                      str(d['lightstime']).encode('ascii'), d['updated'])
+            self._write(DOOR_OFFSET + DOOR_SIZE * index, DOOR, values)
+
+    def publish_sensors(self, **fields):
+        """Function updates the sensor section.  Only control.py should call this.  Fields not given keep their
+        value, so each sensor can be published as it's read."""
+        self._check_fields(fields, SENSOR_FIELDS)
+        with self._write_lock:
+            self._sensors.update(fields)
+            self._write(SENSOR_OFFSET, SENSORS, [float(self._sensors[f]) for f in SENSOR_FIELDS])
+
+    def read_door(self, index=0):
+        """Function returns coop index's door section as a dictionary, or None if main.py hasn't published it."""
+        values = self._read(DOOR_OFFSET + DOOR_SIZE * index, DOOR)
+        if values is None:
+            return None
+        values = list(values)
+        for i in (0, 1, 4, 5, 6):
+            values[i] = values[i].rstrip(b'\0').decode('utf-8', 'replace')
+        return dict(zip(DOOR_FIELDS, values))
+
+    def read_doors(self):
+        """Function returns a list of the door sections main.py has published, one per coop."""
+        doors = [self.read_door(index) for index in range(MAX_COOPS)]
+        return [door for door in doors if door is not None]
+
+    def read_sensors(self):
+        """Function returns the sensor section as a dictionary, or None if control.py hasn't published yet."""
+        values = self._read(SENSOR_OFFSET, SENSORS)
+        if values is None:
+            return None
+        return dict(zip(SENSOR_FIELDS, values))
+
+    def _write(self, offset, layout, values):
+        seq = SEQ.unpack_from(self.buf, offset)[0]
+        seq += seq & 1  # Left odd by a writer killed part way through a write, start from the next even number.
+        SEQ.pack_into(self.buf, offset, (seq + 1) & 0xFFFFFFFF)  # Odd, readers will retry.
+        layout.pack_into(self.buf, offset + SEQ.size, *values)
+        SEQ.pack_into(self.buf, offset, (seq + 2) & 0xFFFFFFFF)  # Even again, write is complete.
+
+    def _read(self, offset, layout):
+        for _ in range(READ_RETRIES):
+            before = SEQ.unpack_from(self.buf, offset)[0]
+            if before & 1:
+                time.sleep(0)  # Writer is part way through, let it finish.
+                continue
+            values = layout.unpack_from(self.buf, offset + SEQ.size)
+            if SEQ.unpack_from(self.buf, offset)[0] == before:
+                return values if before else None
+        return None
+
+    @staticmethod
+    def _check_fields(fields, allowed):
+        unknown = set(fields) - set(allowed)
+        if unknown:
+            raise KeyError('Unknown state bus fields: ' + ', '.join(sorted(unknown)))
+
+
+def _open_segment(name):
+    """Creates the segment, or attaches to it if it exists.  A segment left over from a different layout is replaced.
+    main.py and control.py often start together at boot, so a segment that another process has only just created
+    (still empty or with no header yet) is waited for rather than replaced."""
+    try:
+        shm = _shared_memory(name, create=True, size=BUS_SIZE)
+        HEADER.pack_into(shm.buf, 0, MAGIC, LAYOUT_VERSION)
+        return shm
+    except FileExistsError:
+        pass
+    deadline = time.monotonic() + ATTACH_WAIT
+    while True:
+        try:
+            shm = _shared_memory(name)
+        except FileNotFoundError:
+            return _open_segment(name)  # Removed while we were looking, start again.
+        except ValueError:
+            shm = None  # Created but not sized yet.
+        if shm is not None and shm.size >= HEADER.size:
+            header = HEADER.unpack_from(shm.buf, 0)
+            if shm.size >= BUS_SIZE and header == (MAGIC, LAYOUT_VERSION):
+                return shm
+            if header[0] != bytes(4) or time.monotonic() >= deadline:
+                # A different layout, or a creator that died before writing the header.
+                _unlink(shm)
+                return _open_segment(name)
+        if shm is not None:
+            shm.close()
+        if time.monotonic() >= deadline:
+            raise OSError('state bus ' + name + ' was created but never set up')
+        time.sleep(0.01)  # Creator hasn't finished setting the segment up yet.
+
+
+def _unlink(shm):
+    """Removes a segment opened by _shared_memory.  Before Python 3.13 unlink also unregisters the segment from the
+    resource tracker, so it's registered again first to keep the tracker from complaining."""
+    if getattr(shm, '_track', True):
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.close()
+    shm.unlink()
+
+
+def _shared_memory(name, create=False, size=0):
+    """Opens a SharedMemory without Python's resource tracker, which would otherwise remove the segment as soon as
+    any one process using it exits."""
+    try:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)  # Python 3.13+
+    except TypeError:
+        pass
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name, create=create, size=size)
+    try:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm